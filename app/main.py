@@ -1,87 +1,111 @@
-from fastapi import FastAPI, HTTPException, status
-from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Any
-from datetime import date
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from cachetools import TTLCache # Cache em memória com expiração
+import orjson
+import zlib
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Annotated, List, Literal, Optional
+from datetime import date, datetime
 import os
-from motor.motor_asyncio import AsyncIOMotorClient # Usando Motor para MongoDB assíncrono
+import logging
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase # Usando Motor para MongoDB assíncrono
 from bson import ObjectId
-from pydantic_core import core_schema # Necessário para a nova implementação de PyObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-# --- 1. Configuração da Aplicação FastAPI ---
-app = FastAPI(
-    title="MongoUserAPI",
-    description="API RESTful para gerenciamento de usuários com MongoDB e FastAPI.",
-    version="1.0.0"
-)
-
-# --- 2. Configuração do Banco de Dados MongoDB ---
+# --- 1. Configuração do Banco de Dados MongoDB ---
 MONGO_DETAILS = os.getenv("MONGO_DETAILS", "mongodb://localhost:27017")
-client = None
-db = None
+LIST_MAX_USERS = 1000 # Máximo de usuários retornados por página em /users/
+BULK_MAX_USERS = 1000 # Máximo de usuários aceitos por requisição em /users/bulk
+log = logging.getLogger("mongouserapi")
 
-# Função para conectar ao MongoDB
-def connect_to_mongo():
-    global client, db
-    try:
-        client = AsyncIOMotorClient(MONGO_DETAILS) # Usando AsyncIOMotorClient
-        db = client.users_db
-        print("Conectado ao MongoDB com sucesso!")
-    except Exception as e:
-        print(f"Erro ao conectar ao MongoDB: {e}")
-
-def close_mongo_connection():
-    global client
-    if client:
-        client.close()
-        print("Conexão com MongoDB fechada.")
-
-@app.on_event("startup")
-async def startup_db_client():
-    connect_to_mongo()
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    close_mongo_connection()
+# Cache de GET /users/{user_id}: ObjectId -> (corpo JSON já serializado, ETag).
+# É por processo, então a expiração limita o tempo em que outro worker pode servir um dado desatualizado.
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+# Geração incrementada a cada PUT/DELETE: uma leitura só preenche o cache se nenhuma escrita aconteceu
+# durante a busca no MongoDB (senão gravaria no cache um usuário desatualizado ou já removido).
+# Um contador único (e não um por usuário) mantém a memória constante; o custo é apenas pular o cache nesse caso.
+_user_generation = 0
 
-# --- 3. Modelagem de Dados (Pydantic) ---
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_pydantic_core_schema__(cls, _source_type: Any, _handler: Any) -> core_schema.CoreSchema:
-        # Define como o Pydantic deve tratar ObjectId para JSON e Python
-        return core_schema.json_or_python_schema(
-            json_schema=core_schema.str_schema(), # No JSON, será uma string
-            python_schema=core_schema.union_schema([ # No Python, pode ser ObjectId ou string
-                core_schema.is_instance_schema(ObjectId),
-                core_schema.chain_schema([
-                    core_schema.str_schema(),
-                    core_schema.no_info_plain_validator_function(cls.validate) # Usa nosso validador
-                ])
-            ])
+# Cria o índice único de e-mail. Bancos antigos podem já ter e-mails repetidos (a checagem anterior, busca + inserção,
+# tinha condição de corrida); nesse caso o MongoDB recusa o índice: registra quais e-mails colidem e interrompe a inicialização.
+async def ensure_email_index(db: AsyncIOMotorDatabase) -> None:
+    try:
+        await db.users.create_index("email", unique=True)
+    except DuplicateKeyError:
+        duplicates = await db.users.aggregate([
+            {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ]).to_list(length=None)
+        log.error(
+            "Não foi possível criar o índice único de e-mail. E-mails duplicados: %s",
+            ", ".join(str(d["_id"]) for d in duplicates)
         )
+        raise RuntimeError("Remova os e-mails duplicados da coleção users antes de iniciar a API.") from None
+
+# Ciclo de vida da aplicação: um único cliente (e pool de conexões) por processo, guardado em app.state
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.basicConfig(level=logging.INFO) # StreamHandler no logger raiz
+    app.state.client = AsyncIOMotorClient( # Usando AsyncIOMotorClient
+        MONGO_DETAILS,
+        minPoolSize=10, # Mantém conexões abertas para evitar o custo de conexão na primeira requisição
+        maxPoolSize=50,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=2000,
+        heartbeatFrequencyMS=10000, # Intervalo do monitoramento do servidor (menos tráfego em segundo plano)
+        appname="MongoUserAPI" # Identifica a aplicação nos logs/profiler do MongoDB
+    )
+    app.state.db = app.state.client.users_db
+    # Falha logo na inicialização se o MongoDB estiver inacessível e já abre a primeira conexão do pool
+    # (o driver completa o pool até minPoolSize em segundo plano)
+    await app.state.client.admin.command("ping")
+    log.info("Conectado ao MongoDB com sucesso!")
+    # Índice único: o próprio MongoDB garante que não haja e-mails duplicados
+    await ensure_email_index(app.state.db)
+    yield
+    app.state.client.close()
+    log.info("Conexão com MongoDB fechada.")
+
+# Dependência que entrega o banco de dados da aplicação às rotas
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    return request.app.state.db
 
-    @classmethod
-    def validate(cls, v: Any) -> ObjectId:
-        if isinstance(v, ObjectId):
-            return v
-        if isinstance(v, str) and ObjectId.is_valid(v):
-            return ObjectId(v)
-        raise ValueError("ID de objeto inválido")
+# --- 2. Configuração da Aplicação FastAPI ---
+# Resposta JSON serializada com orjson (mais rápido que o json da biblioteca padrão).
+# Substitui o ORJSONResponse do FastAPI, que foi descontinuado.
+class OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
+app = FastAPI(
+    title="MongoUserAPI",
+    description="API RESTful para gerenciamento de usuários com MongoDB e FastAPI.",
+    version="1.0.0",
+    default_response_class=OrjsonResponse,
+    lifespan=lifespan
+)
+app.add_middleware(GZipMiddleware, minimum_size=1024) # Comprime respostas grandes (ex: listagem de usuários)
+
+# --- 3. Modelagem de Dados (Pydantic) ---
 # Modelo base para um usuário
 class UserBase(BaseModel):
     name: str = Field(..., min_length=3, max_length=50, description="Nome completo do usuário")
     email: EmailStr = Field(..., description="Endereço de e-mail único do usuário")
     birth_date: date = Field(..., description="Data de nascimento do usuário (formato YYYY-MM-DD)")
 
-    class Config:
-        arbitrary_types_allowed = True # Permite que o Pydantic use tipos personalizados como PyObjectId
-        json_schema_extra = { # Usando json_schema_extra para evitar o aviso
+    model_config = ConfigDict(
+        json_schema_extra={ # Usando json_schema_extra para evitar o aviso
             "example": {
                 "name": "João Silva",
                 "email": "joao.silva@example.com",
                 "birth_date": "1990-01-15"
             }
         }
+    )
 
 class UserCreate(UserBase):
     pass
@@ -91,23 +115,22 @@ class UserUpdate(BaseModel):
     email: Optional[EmailStr] = Field(None, description="Novo endereço de e-mail único do usuário")
     birth_date: Optional[date] = Field(None, description="Nova data de nascimento do usuário (formato YYYY-MM-DD)")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "name": "João Victor",
                 "email": "joao.victor@example.com"
             }
         }
+    )
 
 class UserInDB(UserBase):
-    # default_factory=PyObjectId é uma boa prática para gerar IDs automaticamente se não fornecidos
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id", description="ID único do usuário no MongoDB")
-
-    class Config:
-        populate_by_name = True # Permite que o Pydantic mapeie '_id' para 'id'
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str} # Converte ObjectId para string ao serializar para JSON
-        json_schema_extra = {
+    # O ID vem sempre do MongoDB e é convertido para string ao sair do banco (ver _from_db)
+    id: str = Field(..., alias="_id", description="ID único do usuário no MongoDB")
+
+    model_config = ConfigDict(
+        populate_by_name=True, # Permite que o Pydantic mapeie '_id' para 'id'
+        json_schema_extra={
             "example": {
                 "id": "60c72b2f9b1d4c001f8e4d6a",
                 "name": "Maria Souza",
@@ -115,6 +138,67 @@ class UserInDB(UserBase):
                 "birth_date": "1985-05-20"
             }
         }
+    )
+
+# Resultado de POST /users/bulk (usado apenas na documentação; a rota devolve o dicionário diretamente)
+class BulkCreateResult(BaseModel):
+    inserted: int = Field(..., description="Quantidade de usuários criados")
+    results: List[Literal["ok", "duplicate", "error"]] = Field(
+        ..., description="Resultado de cada usuário, na mesma ordem do envio"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "inserted": 2,
+                "results": ["ok", "duplicate", "ok"]
+            }
+        }
+    )
+
+# Monta o documento a ser inserido diretamente a partir dos três campos conhecidos, sem model_dump.
+# birth_date é gravada como string "YYYY-MM-DD": já sai pronta para o JSON, sem conversão de datas na leitura.
+def _to_db(user: UserCreate) -> dict:
+    return {"name": user.name, "email": user.email, "birth_date": user.birth_date.isoformat()}
+
+# birth_date é gravada como string "YYYY-MM-DD", mas documentos antigos (ou inseridos direto no MongoDB) podem
+# ter uma data BSON, que o driver devolve como datetime: normaliza para o mesmo formato em vez de expor o horário.
+def _birth_date_str(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat()
+
+# Prepara um documento do MongoDB para a resposta JSON, sem passar pelo Pydantic (dados já validados na inserção).
+# Monta um dicionário novo só com os campos da resposta. Não usa dataclass: o orjson ignora campos que começam com "_" (como "_id").
+def _from_db(doc: dict) -> dict:
+    return {"_id": str(doc["_id"]), "name": doc["name"], "email": doc["email"], "birth_date": _birth_date_str(doc["birth_date"])}
+
+# Valida e converte o ID recebido na URL uma única vez por valor (IDs repetidos são comuns nas rotas)
+@lru_cache(maxsize=4096)
+def _oid(user_id: str) -> Optional[ObjectId]:
+    return ObjectId(user_id) if ObjectId.is_valid(user_id) else None
+
+# Invalida o cache de leitura de um usuário após uma escrita
+def _invalidate_user(oid: ObjectId) -> None:
+    global _user_generation
+    _user_cache.pop(oid, None)
+    _user_generation += 1
+
+# Compara o ETag com o cabeçalho If-None-Match ("*" ou lista separada por vírgulas; comparação fraca)
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+# Dependência das rotas /users/{user_id}: rejeita IDs inválidos antes de chegar à rota
+def valid_oid(user_id: str) -> ObjectId:
+    oid = _oid(user_id)
+    if oid is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ID inválido")
+    return oid
 
 # --- 4. Rotas da API (CRUD) ---
 
@@ -124,78 +208,131 @@ async def read_root():
 
 @app.post(
     "/users/",
-    response_model=UserInDB,
     status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_201_CREATED: {"model": UserInDB}},
     summary="Cria um novo usuário",
     response_description="O usuário recém-criado com seu ID do MongoDB"
 )
-async def create_user(user: UserCreate):
-    # Verifica se já existe um usuário com o mesmo e-mail
-    if await db.users.find_one({"email": user.email}):
+async def create_user(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
+    user_dict = _to_db(user)
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError: # Violação do índice único de e-mail
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Já existe um usuário com este e-mail."
         )
-    user_dict = user.model_dump(by_alias=True, exclude_none=True) # Use model_dump para Pydantic V2
-    result = await db.users.insert_one(user_dict)
-    created_user = await db.users.find_one({"_id": result.inserted_id})
-    if created_user:
-        return UserInDB(**created_user)
-    raise HTTPException(status_code=500, detail="Erro ao recuperar usuário criado.")
+    # O documento inserido já é conhecido; não é preciso buscá-lo novamente
+    created_user = {**user_dict, "_id": result.inserted_id}
+    return OrjsonResponse(status_code=status.HTTP_201_CREATED, content=_from_db(created_user))
+
+@app.post(
+    "/users/bulk",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_201_CREATED: {"model": BulkCreateResult},
+        status.HTTP_207_MULTI_STATUS: {
+            "model": BulkCreateResult,
+            "description": "Inserção parcial: ao menos um usuário não foi criado (ex: e-mail duplicado)"
+        }
+    },
+    summary="Cria vários usuários de uma vez",
+    response_description="Resultado da inserção de cada usuário, na mesma ordem do envio"
+)
+async def create_users_bulk(
+    # O limite faz parte do schema: listas grandes demais são rejeitadas sem validar cada usuário
+    users: Annotated[List[UserCreate], Body(min_length=1, max_length=BULK_MAX_USERS)],
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    docs = [_to_db(user) for user in users]
+    results = ["ok"] * len(docs)
+    try:
+        # ordered=False: um e-mail duplicado não interrompe a inserção dos demais
+        await db.users.insert_many(docs, ordered=False, bypass_document_validation=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            results[error["index"]] = "duplicate" if error.get("code") == 11000 else "error"
+    inserted = results.count("ok")
+    return OrjsonResponse(
+        status_code=status.HTTP_201_CREATED if inserted == len(results) else status.HTTP_207_MULTI_STATUS,
+        content={"inserted": inserted, "results": results}
+    )
 
 
 @app.get(
     "/users/",
-    response_model=List[UserInDB],
+    responses={200: {"model": List[UserInDB]}},
     summary="Lista todos os usuários",
     response_description="Lista de todos os usuários cadastrados"
 )
-async def list_users():
+async def list_users(
+    limit: int = Query(LIST_MAX_USERS, ge=1, le=LIST_MAX_USERS, description="Quantidade máxima de usuários retornados"),
+    skip: int = Query(0, ge=0, description="Quantidade de usuários a pular (paginação)"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    # Busca apenas os campos necessários e consome o cursor em lotes, sem carregar tudo de uma vez.
+    # Ordena por _id (já indexado) para que a paginação com skip/limit seja estável entre páginas.
+    cursor = db.users.find(
+        {}, {"name": 1, "email": 1, "birth_date": 1}, skip=skip, limit=limit
+    ).sort("_id", 1).batch_size(200)
     users = []
-    # Use to_list() para iterar sobre o cursor assíncrono
-    for user in await db.users.find().to_list(length=1000): # Limite de 1000 documentos para evitar sobrecarga
-        users.append(UserInDB(**user))
-    return users
+    async for user in cursor:
+        users.append(_from_db(user))
+    return OrjsonResponse(content=users)
 
 @app.get(
     "/users/{user_id}",
-    response_model=UserInDB,
+    responses={200: {"model": UserInDB}},
     summary="Busca um usuário por ID",
     response_description="Detalhes do usuário encontrado"
 )
-async def get_user(user_id: str):
-    if not ObjectId.is_valid(user_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ID inválido")
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado")
-    return UserInDB(**user)
+async def get_user(request: Request, oid: ObjectId = Depends(valid_oid), db: AsyncIOMotorDatabase = Depends(get_db)):
+    cached = _user_cache.get(oid)
+    if cached is None:
+        generation = _user_generation
+        user = await db.users.find_one({"_id": oid})
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado")
+        body = orjson.dumps(_from_db(user))
+        # ETag derivado do conteúdo: muda sempre que o usuário é alterado
+        cached = (body, f'W/"{oid}-{zlib.crc32(body):08x}"')
+        if _user_generation == generation: # Nenhuma escrita durante a busca
+            _user_cache[oid] = cached
+    body, etag = cached
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.put(
     "/users/{user_id}",
-    response_model=UserInDB,
+    responses={200: {"model": UserInDB}},
     summary="Atualiza um usuário",
     response_description="Usuário atualizado"
 )
-async def update_user(user_id: str, user_update: UserUpdate):
-    if not ObjectId.is_valid(user_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ID inválido")
-    
+async def update_user(user_update: UserUpdate, oid: ObjectId = Depends(valid_oid), db: AsyncIOMotorDatabase = Depends(get_db)):
     # Converte o modelo Pydantic para um dicionário, excluindo campos None
-    update_data = user_update.model_dump(exclude_none=True) # Use model_dump para Pydantic V2
+    # mode="json" grava birth_date como string "YYYY-MM-DD", no mesmo formato de _to_db
+    update_data = user_update.model_dump(mode="json", exclude_none=True) # Use model_dump para Pydantic V2
     
     if not update_data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nenhum dado para atualizar.")
     
-    result = await db.users.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
+    # Atualiza e retorna o documento já atualizado em uma única operação
+    try:
+        user = await db.users.find_one_and_update(
+            {"_id": oid}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError: # Violação do índice único de e-mail
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Já existe um usuário com este e-mail."
+        )
+    _invalidate_user(oid)
     
-    if result.matched_count == 0:
+    if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado")
     
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user:
-        return UserInDB(**user)
-    raise HTTPException(status_code=500, detail="Erro ao recuperar usuário atualizado.")
+    return OrjsonResponse(content=_from_db(user))
 
 @app.delete(
     "/users/{user_id}",
@@ -203,11 +340,9 @@ async def update_user(user_id: str, user_update: UserUpdate):
     summary="Remove um usuário",
     response_description="Usuário removido com sucesso"
 )
-async def delete_user(user_id: str):
-    if not ObjectId.is_valid(user_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ID inválido")
-    
-    result = await db.users.delete_one({"_id": ObjectId(user_id)})
+async def delete_user(oid: ObjectId = Depends(valid_oid), db: AsyncIOMotorDatabase = Depends(get_db)):
+    result = await db.users.delete_one({"_id": oid})
+    _invalidate_user(oid)
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado")
@@ -0,0 +1,243 @@
+# Testes das rotas com uma coleção falsa em memória (não precisa de MongoDB rodando)
+# Executar com: pip install -r requirements-dev.txt && python -m pytest (dentro de app/)
+from types import SimpleNamespace
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import main
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def batch_size(self, _size):
+        return self
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return dict(next(self._it))
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeList:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeCollection:
+    """Coleção em memória com o índice único de e-mail já criado (como após o lifespan)."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _check_email(self, email, _id=None):
+        if any(doc["email"] == email and doc["_id"] != _id for doc in self.docs.values()):
+            raise DuplicateKeyError("E11000 duplicate key error", 11000)
+
+    async def create_index(self, key, unique=False):
+        if unique and len({doc[key] for doc in self.docs.values()}) < len(self.docs):
+            raise DuplicateKeyError("E11000 duplicate key error", 11000)
+
+    def aggregate(self, _pipeline):
+        # Só o pipeline usado em ensure_email_index: e-mails que aparecem mais de uma vez
+        counts = Counter(doc["email"] for doc in self.docs.values())
+        return FakeList([{"_id": email, "count": n} for email, n in counts.items() if n > 1])
+
+    async def insert_one(self, doc):
+        self._check_email(doc["email"])
+        doc["_id"] = ObjectId()
+        self.docs[doc["_id"]] = dict(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True, bypass_document_validation=False):
+        # ordered=False: insere o que for possível e reporta os erros de cada posição no final
+        write_errors = []
+        for index, doc in enumerate(docs):
+            try:
+                await self.insert_one(doc)
+            except DuplicateKeyError:
+                write_errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(docs) - len(write_errors)})
+
+    def find(self, _filter, _projection=None, skip=0, limit=0):
+        docs = list(self.docs.values())[skip:]
+        return FakeCursor(docs[:limit] if limit else docs)
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        if "email" in update["$set"]:
+            self._check_email(update["$set"]["email"], doc["_id"])
+        doc.update(update["$set"])
+        return dict(doc)
+
+    async def delete_one(self, query):
+        return SimpleNamespace(deleted_count=1 if self.docs.pop(query["_id"], None) else 0)
+
+
+@pytest.fixture
+def client():
+    db = SimpleNamespace(users=FakeCollection())
+    main.app.dependency_overrides[main.get_db] = lambda: db
+    main._user_cache.clear()
+    yield TestClient(main.app) # Sem "with": o lifespan (conexão real com o MongoDB) não é executado
+    main.app.dependency_overrides.clear()
+
+
+USER = {"name": "João Silva", "email": "joao.silva@example.com", "birth_date": "1990-01-15"}
+
+
+def test_responses_include_id(client):
+    created = client.post("/users/", json=USER)
+    assert created.status_code == 201
+    user_id = created.json()["_id"]
+    assert ObjectId.is_valid(user_id)
+
+    listed = client.get("/users/")
+    assert [u["_id"] for u in listed.json()] == [user_id]
+
+    fetched = client.get(f"/users/{user_id}")
+    assert fetched.json() == {"_id": user_id, **USER}
+
+    updated = client.put(f"/users/{user_id}", json={"name": "João Victor"})
+    assert updated.json()["_id"] == user_id
+
+
+def test_if_none_match_accepts_lists_and_wildcard(client):
+    user_id = client.post("/users/", json=USER).json()["_id"]
+    etag = client.get(f"/users/{user_id}").headers["etag"]
+
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": f'"outro", {etag}'}).status_code == 304
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": '"outro"'}).status_code == 200
+
+
+def test_write_during_fetch_does_not_fill_cache(client):
+    user_id = client.post("/users/", json=USER).json()["_id"]
+    users = main.app.dependency_overrides[main.get_db]().users
+    find_one = users.find_one
+
+    async def find_one_then_delete(query):
+        doc = await find_one(query)
+        main._invalidate_user(query["_id"]) # Simula um DELETE concluído durante a busca
+        return doc
+
+    users.find_one = find_one_then_delete
+    assert client.get(f"/users/{user_id}").status_code == 200
+    assert ObjectId(user_id) not in main._user_cache
+
+
+def test_bulk_rejects_oversized_body_before_validating_items(client):
+    users = [{"name": "x", "email": "inválido"}] * (main.BULK_MAX_USERS + 1)
+    response = client.post("/users/bulk", json=users)
+    assert response.status_code == 422
+    assert [error["type"] for error in response.json()["detail"]] == ["too_long"]
+
+
+def test_update_to_existing_email_returns_400(client):
+    client.post("/users/", json=USER)
+    other_id = client.post("/users/", json={**USER, "email": "maria.souza@example.com"}).json()["_id"]
+    response = client.put(f"/users/{other_id}", json={"email": USER["email"]})
+    assert response.status_code == 400
+
+
+def test_email_index_reports_existing_duplicates(caplog):
+    users = FakeCollection()
+    for email in ["a@example.com", "a@example.com", "b@example.com"]:
+        _id = ObjectId()
+        users.docs[_id] = {"_id": _id, "name": "Fulano", "email": email, "birth_date": "1990-01-15"}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.ensure_email_index(SimpleNamespace(users=users)))
+    assert "a@example.com" in caplog.text
+    assert "b@example.com" not in caplog.text
+
+
+def test_bulk_creates_all_users(client):
+    users = [{**USER, "email": f"usuario{i}@example.com"} for i in range(3)]
+    response = client.post("/users/bulk", json=users)
+    assert response.status_code == 201
+    assert response.json() == {"inserted": 3, "results": ["ok", "ok", "ok"]}
+    assert len(client.get("/users/").json()) == 3
+
+
+def test_bulk_reports_duplicates_per_row(client):
+    client.post("/users/", json=USER)
+    users = [
+        {**USER, "email": "nova@example.com"},
+        USER, # Já existe no banco
+        {**USER, "email": "outra@example.com"},
+        {**USER, "email": "nova@example.com"} # Repetido dentro do próprio lote
+    ]
+    response = client.post("/users/bulk", json=users)
+    assert response.status_code == 207
+    assert response.json() == {"inserted": 2, "results": ["ok", "duplicate", "ok", "duplicate"]}
+
+
+def test_bulk_maps_other_write_errors_to_error(client):
+    users_collection = main.app.dependency_overrides[main.get_db]().users
+
+    async def insert_many(docs, **_kwargs):
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}]})
+
+    users_collection.insert_many = insert_many
+    users = [{**USER, "email": f"usuario{i}@example.com"} for i in range(2)]
+    response = client.post("/users/bulk", json=users)
+    assert response.status_code == 207
+    assert response.json() == {"inserted": 1, "results": ["ok", "error"]}
+
+
+def test_legacy_datetime_birth_date_is_returned_as_date(client):
+    users = main.app.dependency_overrides[main.get_db]().users
+    _id = ObjectId()
+    users.docs[_id] = {**USER, "_id": _id, "birth_date": datetime(1990, 1, 15)} # Como o driver devolve uma data BSON
+    assert client.get(f"/users/{_id}").json()["birth_date"] == "1990-01-15"
+    assert client.get("/users/").json()[0]["birth_date"] == "1990-01-15"
+
+
+def test_put_invalidates_warm_cache(client):
+    user_id = client.post("/users/", json=USER).json()["_id"]
+    before = client.get(f"/users/{user_id}")
+    assert ObjectId(user_id) in main._user_cache
+
+    client.put(f"/users/{user_id}", json={"name": "João Victor"})
+    after = client.get(f"/users/{user_id}")
+    assert after.json()["name"] == "João Victor"
+    assert after.headers["etag"] != before.headers["etag"]
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": before.headers["etag"]}).status_code == 200
+
+
+def test_delete_invalidates_warm_cache(client):
+    user_id = client.post("/users/", json=USER).json()["_id"]
+    client.get(f"/users/{user_id}")
+    assert ObjectId(user_id) in main._user_cache
+
+    assert client.delete(f"/users/{user_id}").status_code == 204
+    assert client.get(f"/users/{user_id}").status_code == 404